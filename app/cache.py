@@ -1,8 +1,16 @@
-from redis.asyncio import Redis
-from .config import settings
+from redis.asyncio import BlockingConnectionPool, Redis
+from .config import get_settings
 
 
-redis_client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+# Bounded pool: callers queue for a connection (up to the pool timeout)
+# instead of opening unbounded connections under burst load.
+_pool = BlockingConnectionPool.from_url(
+    get_settings().REDIS_URL,
+    max_connections=get_settings().REDIS_POOL_SIZE,
+    timeout=get_settings().REDIS_POOL_TIMEOUT,
+    decode_responses=True,
+)
+redis_client = Redis(connection_pool=_pool)
 
 
 async def ping() -> bool:
@@ -1,56 +1,116 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from pathlib import Path
-import yaml
+from functools import lru_cache
+import json
+import os
+
+# resolve() stats the filesystem; do it once at import
+_BASE = Path(__file__).resolve().parent
 
 
 class Settings(BaseSettings):
     DATABASE_URL: str = "postgresql+asyncpg://postgres@localhost:5432/goride"
     REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_POOL_SIZE: int = 50
+    REDIS_POOL_TIMEOUT: int = 5
     MATCH_RADIUS_KM: float = 5.0
     ASSIGNMENT_TTL_SEC: int = 10
+    BG_MAX_CONCURRENCY: int = 64
     
-    DB_POOL_SIZE: int = 5
-    DB_MAX_OVERFLOW: int = 10
+    # Sized for concurrent async handlers; keep pool_size + max_overflow
+    # below Postgres max_connections / number of workers when tuning.
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
     DB_POOL_TIMEOUT: int = 30
     DB_POOL_RECYCLE: int = -1
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_USE_LIFO: bool = True
     DB_ECHO: bool = False
 
-    # Load .env located next to this file (app/.env) so defaults are overridden
-    model_config = {"env_file": str(Path(__file__).resolve().parent / ".env")}
+    # Load .env located next to this file (app/.env) so defaults are
+    # overridden. frozen skips setattr validation machinery and makes the
+    # singleton safely shareable; extra="ignore" skips unknown-env scans.
+    model_config = SettingsConfigDict(
+        env_file=str(_BASE / ".env"),
+        frozen=True,
+        extra="ignore",
+    )
+
+
+def _parse_yaml_config(config_path: Path) -> dict:
+    """Parse application.yaml into a flat Settings-compatible dict."""
+    # Imported lazily: env-only deploys (no application.yaml) and cache hits
+    # never pay the PyYAML import cost
+    import yaml
+
+    config_dict = {}
+    with open(config_path, "r") as f:
+        # Prefer the libyaml-backed loader when PyYAML was built with it;
+        # falls back to the pure-Python SafeLoader otherwise
+        yaml_config = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+        if yaml_config:
+            # Map YAML structure to Settings fields
+            if "database" in yaml_config:
+                db = yaml_config["database"]
+                config_dict["DATABASE_URL"] = db.get("url")
+                config_dict["DB_POOL_SIZE"] = db.get("pool_size")
+                config_dict["DB_MAX_OVERFLOW"] = db.get("max_overflow")
+                config_dict["DB_POOL_TIMEOUT"] = db.get("pool_timeout")
+                config_dict["DB_POOL_RECYCLE"] = db.get("pool_recycle")
+                config_dict["DB_ECHO"] = db.get("echo")
+            
+            if "redis" in yaml_config:
+                config_dict["REDIS_URL"] = yaml_config["redis"].get("url")
+            
+            if "matching" in yaml_config:
+                match = yaml_config["matching"]
+                config_dict["MATCH_RADIUS_KM"] = match.get("radius_km")
+                config_dict["ASSIGNMENT_TTL_SEC"] = match.get("assignment_ttl_sec")
+    return config_dict
 
 
 def load_settings() -> Settings:
     """Load settings from application.yaml and merge with environment variables."""
-    config_path = Path(__file__).resolve().parent / "application.yaml"
+    config_path = _BASE / "application.yaml"
+    cache_path = config_path.with_name(config_path.name + ".cache.json")
     
     # Start with defaults
     config_dict = {}
     
-    # Load from YAML if it exists
+    # Load from YAML if it exists, going through a JSON cache of the parsed
+    # result: json.load is much cheaper than YAML parsing, so every worker
+    # start after the first only pays a stdlib JSON read.
     if config_path.exists():
-        with open(config_path, "r") as f:
-            yaml_config = yaml.safe_load(f)
-            if yaml_config:
-                # Map YAML structure to Settings fields
-                if "database" in yaml_config:
-                    db = yaml_config["database"]
-                    config_dict["DATABASE_URL"] = db.get("url")
-                    config_dict["DB_POOL_SIZE"] = db.get("pool_size")
-                    config_dict["DB_MAX_OVERFLOW"] = db.get("max_overflow")
-                    config_dict["DB_POOL_TIMEOUT"] = db.get("pool_timeout")
-                    config_dict["DB_POOL_RECYCLE"] = db.get("pool_recycle")
-                    config_dict["DB_ECHO"] = db.get("echo")
-                
-                if "redis" in yaml_config:
-                    config_dict["REDIS_URL"] = yaml_config["redis"].get("url")
-                
-                if "matching" in yaml_config:
-                    match = yaml_config["matching"]
-                    config_dict["MATCH_RADIUS_KM"] = match.get("radius_km")
-                    config_dict["ASSIGNMENT_TTL_SEC"] = match.get("assignment_ttl_sec")
+        yaml_mtime = config_path.stat().st_mtime
+        if cache_path.exists() and cache_path.stat().st_mtime >= yaml_mtime:
+            with open(cache_path, "r") as f:
+                config_dict = json.load(f)
+        else:
+            config_dict = _parse_yaml_config(config_path)
+            # Write the cache atomically so concurrent workers never see a
+            # partially written file
+            tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(config_dict, f)
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                # Cache is best-effort; fall through with the parsed config
+                pass
     
     # Create Settings with YAML values, but allow env vars to override
     return Settings(**{k: v for k, v in config_dict.items() if v is not None})
 
 
-settings = load_settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Build the Settings singleton on first access."""
+    return load_settings()
+
+
+def __getattr__(name: str):
+    # PEP 562 hook: keep `from app.config import settings` working while
+    # deferring file I/O and parsing until settings are actually read
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
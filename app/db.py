@@ -1,8 +1,12 @@
 
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, text
+import asyncio
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from contextlib import asynccontextmanager
-from .config import settings
+from .config import get_settings
+
+settings = get_settings()
 
 # Ensure the DATABASE_URL uses an async driver (asyncpg) for SQLAlchemy asyncio
 if settings.DATABASE_URL.startswith("postgresql://") and "+asyncpg" not in settings.DATABASE_URL:
@@ -11,20 +15,74 @@ if settings.DATABASE_URL.startswith("postgresql://") and "+asyncpg" not in setti
         "Update your DATABASE_URL or set the DATABASE_URL environment variable accordingly."
     )
 
+# Pin the pool class explicitly: letting SQLAlchemy guess can select the
+# sync QueuePool under asyncpg, which deadlocks under concurrent load.
+# Statement reuse end to end: the enlarged query_cache_size keeps every
+# hoisted statement's compiled form resident, and asyncpg's per-connection
+# prepared-statement cache keeps the server-side plans so hot-path executes
+# ship only binary parameters.
 engine: AsyncEngine = create_async_engine(
     settings.DATABASE_URL,
-    echo=settings.DB_ECHO
+    echo=settings.DB_ECHO,
+    query_cache_size=1200,
+    connect_args={"prepared_statement_cache_size": 1024},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    pool_use_lifo=settings.DB_POOL_USE_LIFO,
 )
 metadata = MetaData()
 
 
 @asynccontextmanager
 async def get_conn():
-    async with engine.begin() as conn:
+    # Acquire the connection here but let the transaction autobegin on the
+    # first execute; handlers that return early (cache hits, validation
+    # failures) never pay a BEGIN/COMMIT round trip. Commit on clean exit;
+    # the connect() context rolls back on error.
+    async with engine.connect() as conn:
         yield conn
+        if conn.in_transaction():
+            await conn.commit()
+
+
+@asynccontextmanager
+async def get_read_conn():
+    # Pure reads: AUTOCOMMIT makes Postgres skip the implicit BEGIN/COMMIT
+    # pair around each statement. Compiled-SQL caching is already shared
+    # engine-wide, so no per-connection cache is needed.
+    async with engine.connect() as conn:
+        yield await conn.execution_options(isolation_level="AUTOCOMMIT")
 
 
 async def init_db():
     from .models import metadata as models_metadata
     async with engine.begin() as conn:
         await conn.run_sync(models_metadata.create_all)
+
+
+async def warm_pool(size: int = 5):
+    """Open `size` pooled connections concurrently so the first requests
+    after boot reuse warm connections instead of paying connect cost."""
+    async def _one():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    await asyncio.gather(*(_one() for _ in range(size)))
+
+
+async def ensure_schema():
+    """Create tables only when they are missing (dev convenience).
+
+    A single information_schema probe replaces the per-table existence
+    checks that metadata.create_all would otherwise run on every boot.
+    """
+    async with engine.begin() as conn:
+        res = await conn.execute(
+            text("SELECT 1 FROM information_schema.tables WHERE table_name = 'rides' LIMIT 1")
+        )
+        if res.first() is None:
+            from .models import metadata as models_metadata
+            await conn.run_sync(models_metadata.create_all)
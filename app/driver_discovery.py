@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 import logging
 from . import services
@@ -8,12 +9,12 @@ from .logging_setup import configure_logging
 configure_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Driver Discovery Service")
+app = FastAPI(title="Driver Discovery Service", default_response_class=ORJSONResponse)
 
 
 class MatchRequest(BaseModel):
     """Request to find a driver for a ride."""
-    ride_id: int
+    ride_id: int | None = None  # optional correlation id, logged only
     pickup_lat: float
     pickup_lon: float
     max_distance_km: float = 5.0  # optional, defaults to config setting
@@ -21,7 +22,7 @@ class MatchRequest(BaseModel):
 
 class MatchResponse(BaseModel):
     """Response with matched driver or None if no driver found."""
-    ride_id: int
+    ride_id: int | None = None
     driver_id: int | None
     distance_km: float | None = None
 
@@ -54,4 +55,4 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8001)
+    uvicorn.run(app, host="127.0.0.1", port=8001, loop="uvloop", http="httptools")
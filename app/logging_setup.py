@@ -1,14 +1,28 @@
 import logging
+import logging.handlers
+import atexit
+import os
 from pathlib import Path
+from queue import SimpleQueue
 
+# resolve() stats the filesystem; do it once at import
+_BASE = Path(__file__).resolve().parent
 
-def configure_logging(log_file: str | None = None, level: int = logging.DEBUG):
-    """Configure simple file logging for the application.
+_listener: logging.handlers.QueueListener | None = None
 
-    Writes logs to `app/logs/goride.log` by default.
+
+def configure_logging(log_file: str | None = None, level: int | None = None):
+    """Configure non-blocking file logging for the application.
+
+    Records are handed to a QueueHandler and written by a background
+    QueueListener thread, so hot paths never block the event loop on file
+    I/O. Writes go to `app/logs/goride.log` by default, rotated at 10MB.
+    Level defaults to INFO; set GORIDE_DEBUG=1 for DEBUG.
     """
-    base = Path(__file__).resolve().parent
-    logs_dir = base / "logs"
+    global _listener
+    if _listener is not None:
+        return
+    logs_dir = _BASE / "logs"
     logs_dir.mkdir(parents=True, exist_ok=True)
     if log_file is None:
         log_file = logs_dir / "goride.log"
@@ -17,13 +31,30 @@ def configure_logging(log_file: str | None = None, level: int = logging.DEBUG):
         if not log_file.is_absolute():
             log_file = logs_dir / log_file
 
-    # Basic file configuration
-    logging.basicConfig(
-        filename=str(log_file),
-        level=level,
-        format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
-        datefmt="%Y-%m-%dT%H:%M:%S",
+    if level is None:
+        level = logging.DEBUG if os.environ.get("GORIDE_DEBUG") else logging.INFO
+
+    # Skip per-record thread/process id lookups
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        str(log_file), maxBytes=10 * 1024 * 1024, backupCount=5
     )
+    file_handler.setFormatter(logging.Formatter(
+        "%(asctime)s %(levelname)s [%(name)s] %(message)s",
+        datefmt="%Y-%m-%dT%H:%M:%S",
+    ))
+
+    queue: SimpleQueue = SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(queue))
+
+    _listener = logging.handlers.QueueListener(queue, file_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
 
 
 def get_logger(name: str):
@@ -1,16 +1,96 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import router as api_router
+from contextlib import asynccontextmanager
+from .routes import router as api_router, warm_known_drivers, DRIVER_DISCOVERY_URL
 from .logging_setup import configure_logging
-from . import services
+from . import db, services
+import httpx
 import logging
 import asyncio
+import os
+
+# Prefer uvloop's libuv-backed event loop; selector-loop syscalls dominate
+# this I/O-bound service under load
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
+# aiohttp-backed httpx transport: aiohttp's C parser and connection handling
+# outperform the default h11 transport for high-QPS service-to-service calls
+try:
+    import aiohttp
+    from httpx_aiohttp import AiohttpTransport
+except ImportError:
+    aiohttp = None
 
 # configure file logging for the app
 configure_logging()
 logger = logging.getLogger("app.main")
 
-app = FastAPI(title="Goride - Ride Hailing API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Starting Goride API application")
+    # DDL runs once per deploy via RUN_MIGRATIONS=1; other workers only pay
+    # a single schema probe instead of create_all's per-table checks. The
+    # schema step must finish before the warm-ups: warm_known_drivers
+    # SELECTs from drivers, which may not exist yet on a fresh database.
+    if os.environ.get("RUN_MIGRATIONS") == "1":
+        await db.init_db()
+    else:
+        await db.ensure_schema()
+    await asyncio.gather(db.warm_pool(), warm_known_drivers())
+    # One pooled client for all /match calls: keep-alive connections skip
+    # the per-request TCP handshake to the discovery service. Ride the
+    # aiohttp transport when available; plain httpx otherwise.
+    if aiohttp is not None:
+        app.state.discovery_client = httpx.AsyncClient(
+            base_url=DRIVER_DISCOVERY_URL,
+            timeout=5.0,
+            transport=AiohttpTransport(client=lambda: aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=200, keepalive_timeout=30),
+            )),
+        )
+    else:
+        app.state.discovery_client = httpx.AsyncClient(
+            base_url=DRIVER_DISCOVERY_URL,
+            timeout=5.0,
+            limits=httpx.Limits(max_keepalive_connections=100, max_connections=500, keepalive_expiry=15.0),
+        )
+    # Bounded payment settlement: requests enqueue ids, a fixed worker pool
+    # drains them in micro-batches
+    services.payment_queue = asyncio.Queue(maxsize=services.PAYMENT_QUEUE_MAX)
+    app.state.payment_queue = services.payment_queue
+    payment_workers = [
+        asyncio.create_task(services.payment_worker(services.payment_queue))
+        for _ in range(services.PAYMENT_WORKERS)
+    ]
+    # Batched driver-location ingestion: heartbeats land in an in-memory
+    # buffer and one pipeline flush per interval writes them to Redis
+    services.loc_flusher_task = asyncio.create_task(services.location_flusher())
+    # geo-index cleanup is event-driven: expired driver hashes are removed
+    # as Redis announces them instead of polling the whole zset
+    expiry_task = asyncio.create_task(services.expired_driver_listener())
+    # one worker expires all overdue assignment offers from the Redis zset
+    assign_expiry_task = asyncio.create_task(services.assignment_expiry_worker())
+    yield
+    assign_expiry_task.cancel()
+    expiry_task.cancel()
+    services.loc_flusher_task.cancel()
+    services.loc_flusher_task = None
+    await services.flush_driver_locations()
+    for w in payment_workers:
+        w.cancel()
+    services.payment_queue = None
+    await app.state.discovery_client.aclose()
+
+
+# orjson serializes responses 3-5x faster than stdlib json and handles
+# datetimes natively
+app = FastAPI(title="Goride - Ride Hailing API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Enable CORS for UI dev server
 app.add_middleware(
@@ -24,20 +104,6 @@ app.add_middleware(
 app.include_router(api_router, prefix="/v1")
 
 
-async def periodic_cache_cleanup():
-    """Run cache cleanup every 60 seconds."""
-    while True:
-        await asyncio.sleep(60)
-        await services.cleanup_stale_drivers()
-
-
-@app.on_event("startup")
-async def _startup_log():
-    logger.info("Starting Goride API application")
-    # Start background cleanup task
-    asyncio.create_task(periodic_cache_cleanup())
-    logger.info("Started periodic cache cleanup task")
-
 
 @app.get("/")
 async def read_root():
@@ -1,4 +1,3 @@
-from datetime import datetime, timezone
 from sqlalchemy import (
     Table,
     Column,
@@ -9,6 +8,7 @@ from sqlalchemy import (
     JSON,
     Boolean,
     MetaData,
+    func,
 )
 
 
@@ -43,7 +43,7 @@ riders = Table(
     Column("mobile_number", String, nullable=False, unique=True),
     Column("email", String, nullable=True),
     Column("address", String, nullable=True),
-    Column("created_at", DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
 )
 
 drivers = Table(
@@ -56,7 +56,7 @@ drivers = Table(
     Column("email", String, nullable=True),
     Column("address", String, nullable=True),
     Column("available", Boolean, default=True),
-    Column("created_at", DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
 )
 
 rides = Table(
@@ -69,7 +69,7 @@ rides = Table(
     Column("tier", String),
     Column("payment_method", String),
     Column("status", String, default=RIDE_SEARCHING),
-    Column("created_at", DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
 )
 
 assignments = Table(
@@ -79,7 +79,7 @@ assignments = Table(
     Column("ride_id", Integer),
     Column("driver_id", Integer),
     Column("status", String, default=ASSIGN_OFFERED),
-    Column("offered_at", DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)),
+    Column("offered_at", DateTime(timezone=True), server_default=func.now()),
     Column("metadata", JSON, nullable=True),
 )
 
@@ -89,7 +89,7 @@ trips = Table(
     Column("id", Integer, primary_key=True),
     Column("ride_id", Integer),
     Column("driver_id", Integer),
-    Column("start_at", DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)),
+    Column("start_at", DateTime(timezone=True), server_default=func.now()),
     Column("end_at", DateTime(timezone=True), nullable=True),
     Column("distance_km", Float, default=0.0),
     Column("duration_sec", Integer, default=0),
@@ -112,6 +112,6 @@ idempotency_keys = Table(
     metadata,
     Column("id", Integer, primary_key=True),
     Column("key", String, unique=True),
-    Column("created_at", DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
     Column("response", JSON, nullable=True),
 )
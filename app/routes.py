@@ -1,127 +1,254 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi import APIRouter, Depends, HTTPException, Header, Path, Request
 from . import db, models, services, schemas
-from .db import init_db
-from sqlalchemy import select, desc
-from typing import Optional
+from .cache import redis_client
+from sqlalchemy import select, desc, bindparam, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Annotated, Optional
 from datetime import datetime, timezone
+import orjson
 import logging
 import asyncio
-import httpx
 
 logger = logging.getLogger(__name__)
 
 # Driver discovery service URL (running as separate service on port 8001)
 DRIVER_DISCOVERY_URL = "http://127.0.0.1:8001"
 
+# Pre-built headers for hand-encoded orjson bodies (httpx's json= kwarg
+# would re-encode with stdlib json)
+_JSON_HDRS = {"content-type": "application/json"}
+
 router = APIRouter()
 
+# Per-worker cache of driver ids known to exist; driver existence flips at
+# most once, so steady-state heartbeats never leave the process. The Redis
+# driver_known flag remains the cross-worker layer behind it.
+_known_drivers: set = set()
+
+
+async def warm_known_drivers():
+    """Preload existing driver ids so heartbeats skip Redis and Postgres."""
+    async with db.engine.connect() as conn:
+        ids = (await conn.execute(select(_drivers_c.id))).scalars().all()
+    _known_drivers.update(ids)
+    logger.info("warm_known_drivers: preloaded %d driver ids", len(ids))
+
+# Column collections bound once; each models.<table>.c access walks
+# module -> table -> ColumnCollection otherwise
+_rides_c = models.rides.c
+_assign_c = models.assignments.c
+_drivers_c = models.drivers.c
+_trips_c = models.trips.c
+_pay_c = models.payments.c
+_idem_c = models.idempotency_keys.c
+
+# Hot-path statements built once at import, selecting only the columns the
+# handlers actually use; a stable statement identity also maximizes hits in
+# SQLAlchemy's compiled-SQL cache
+_SEL_RIDE_WITH_ASSIGN = (
+    select(
+        _rides_c.id, _rides_c.status, _rides_c.pickup, _rides_c.destination,
+        _assign_c.id.label("assign_id"), _assign_c.driver_id, _assign_c.status.label("assign_status"),
+    )
+    .select_from(models.rides.outerjoin(models.assignments, _assign_c.ride_id == _rides_c.id))
+    .where(_rides_c.id == bindparam("rid"))
+)
+_SEL_IDEMPOTENCY = select(_idem_c.response).where(_idem_c.key == bindparam("ikey"))
+_UPD_DRIVER_AVAILABLE = update(models.drivers).where(_drivers_c.id == bindparam("did")).values(available=True)
+_SEL_PAYMENT_RECEIPT = (
+    select(
+        _pay_c.id.label("payment_id"), _pay_c.amount, _pay_c.status.label("payment_status"),
+        _trips_c.id.label("trip_id"), _trips_c.driver_id, _trips_c.distance_km, _trips_c.duration_sec,
+        _rides_c.rider_id, _rides_c.pickup, _rides_c.destination, _rides_c.payment_method,
+    )
+    .select_from(
+        models.payments
+        .join(models.trips, _pay_c.trip_id == _trips_c.id)
+        .join(models.rides, _trips_c.ride_id == _rides_c.id)
+    )
+    .where(_pay_c.trip_id == bindparam("tid"))
+    .order_by(desc(_pay_c.id))
+)
+# Inserts take their column values as execute-time parameters. Registration
+# inserts lean on the UNIQUE(mobile_number) index: ON CONFLICT DO NOTHING
+# RETURNING makes check-then-insert a single, race-free round trip.
+_INS_RIDE = models.rides.insert().returning(_rides_c.id)
+_INS_RIDER = (
+    pg_insert(models.riders)
+    .on_conflict_do_nothing(index_elements=["mobile_number"])
+    .returning(models.riders.c.id)
+)
+_INS_DRIVER = (
+    pg_insert(models.drivers)
+    .on_conflict_do_nothing(index_elements=["mobile_number"])
+    .returning(_drivers_c.id)
+)
+
+# Fused ride + idempotency-key insert: one round trip instead of two, with
+# the response JSON assembled server-side around the generated ride id
+_INS_RIDE_WITH_IDEMPOTENCY = text("""
+    WITH new_ride AS (
+        INSERT INTO rides (rider_id, pickup, destination, tier, payment_method, status, created_at)
+        VALUES (:rider_id, CAST(:pickup AS json), CAST(:destination AS json), :tier, :payment_method, :status, now())
+        RETURNING id
+    ), new_key AS (
+        INSERT INTO idempotency_keys (key, created_at, response)
+        SELECT :ikey, now(),
+               CAST(jsonb_build_object(
+                   'id', new_ride.id, 'status', :status,
+                   'pickup', CAST(:pickup AS jsonb),
+                   'destination', CAST(:destination AS jsonb)) AS json)
+        FROM new_ride
+    )
+    SELECT id FROM new_ride
+""")
+
 
 async def get_conn():
     async with db.get_conn() as conn:
         yield conn
 
 
-@router.on_event("startup")
-async def on_startup():
-    await init_db()
+async def get_read_conn():
+    async with db.get_read_conn() as conn:
+        yield conn
 
 
-@router.post("/rides", response_model=schemas.RideOut)
+@router.post("/rides")
 async def create_ride(req: schemas.RideCreate, request: Request, idempotency_key: Optional[str] = Header(None), conn=Depends(get_conn)):
-    # idempotency
+    # idempotency: Redis first (retries normally hit here), Postgres as the
+    # durable fallback for cache misses
     if idempotency_key:
-        ik_sel = select(models.idempotency_keys).where(models.idempotency_keys.c.key == idempotency_key)
-        ex_res = await conn.execute(ik_sel)
-        ex = ex_res.first()
-        if ex and ex[models.idempotency_keys.c.response]:
-            return ex[models.idempotency_keys.c.response]
-
-    logger.info("create_ride: rider=%s pickup=%s", req.rider_id, req.pickup.dict())
-    res = await conn.execute(
-        models.rides.insert().returning(models.rides.c.id).values(rider_id=req.rider_id, pickup=req.pickup.dict(), destination=req.destination.dict(), tier=req.tier, payment_method=req.payment_method, status=models.RIDE_SEARCHING, created_at=datetime.now(timezone.utc))
-    )
-    ride_id = res.scalar_one()
-    status = models.RIDE_SEARCHING
-
-    # Call driver discovery service to find a nearby driver
-    try:
-        async with httpx.AsyncClient() as client:
-            match_resp = await client.post(
-                f"{DRIVER_DISCOVERY_URL}/match",
-                json={"ride_id": ride_id, "pickup_lat": req.pickup.lat, "pickup_lon": req.pickup.lon},
-                timeout=5.0
-            )
+        cached = await redis_client.get(f"idem:{idempotency_key}")
+        if cached:
+            return orjson.loads(cached)
+        cached_resp = (await conn.execute(_SEL_IDEMPOTENCY, {"ikey": idempotency_key})).scalar()
+        if cached_resp:
+            return cached_resp
+
+    # dump the nested location models once; each model_dump() rebuilds a
+    # fresh dict and create_ride needs both points several times
+    pickup_d = req.pickup.model_dump()
+    dest_d = req.destination.model_dump()
+
+    # gate hot-path logging so silenced levels skip record construction
+    # entirely
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("create_ride: rider=%s pickup=%s", req.rider_id, pickup_d)
+
+    # Kick off driver discovery immediately so the HTTP match overlaps the
+    # ride INSERT; the match only needs the pickup point. The pooled client
+    # lives on app.state (created in the lifespan).
+    match_task = None
+    client = getattr(request.app.state, "discovery_client", None)
+    if client is not None:
+        match_task = asyncio.create_task(client.post(
+            "/match",
+            content=orjson.dumps({"pickup_lat": req.pickup.lat, "pickup_lon": req.pickup.lon}),
+            headers=_JSON_HDRS,
+        ))
+
+    async def _resolve_match():
+        if match_task is None:
+            return None
+        try:
+            match_resp = await match_task
             if match_resp.status_code == 200:
-                match_data = match_resp.json()
-                driver_id = match_data.get("driver_id")
-                if driver_id:
-                    # Create assignment if driver found
-                    async with db.engine.begin() as conn2:
-                        await services.create_assignment(conn2, ride_id, driver_id)
-                        status = models.RIDE_ASSIGNED
-                        logger.info("assignment_created_from_discovery: ride=%s driver=%s", ride_id, driver_id)
-            else:
-                logger.warning("driver_discovery_error: ride=%s status=%s", ride_id, match_resp.status_code)
-    except Exception as e:
-        logger.error("driver_discovery_call_failed: ride=%s error=%s", ride_id, e)
-        # Continue without assignment; ride remains in SEARCHING state
+                return orjson.loads(match_resp.content).get("driver_id")
+            logger.warning("driver_discovery_error: status=%s", match_resp.status_code)
+        except Exception as e:
+            logger.error("driver_discovery_call_failed: error=%s", e)
+        return None
 
-    output = schemas.RideOut(id=ride_id, status=status, pickup=req.pickup.dict(), destination=req.destination.dict())
     if idempotency_key:
-        await conn.execute(models.idempotency_keys.insert().values(key=idempotency_key, response=output.dict()))
+        # the fused insert caches the response, so the final status has to
+        # be known up front: await the match, then one CTE round trip
+        driver_id = await _resolve_match()
+        status = models.RIDE_ASSIGNED if driver_id else models.RIDE_NO_DRIVER
+        res = await conn.execute(_INS_RIDE_WITH_IDEMPOTENCY, {
+            "rider_id": req.rider_id,
+            "pickup": orjson.dumps(pickup_d).decode(),
+            "destination": orjson.dumps(dest_d).decode(),
+            "tier": req.tier,
+            "payment_method": req.payment_method,
+            "status": status,
+            "ikey": idempotency_key,
+        })
+        ride_id = res.scalar_one()
+    else:
+        # common path: INSERT and match run concurrently; end-to-end cost is
+        # max(db_insert, http_match) instead of their sum. create_assignment
+        # flips the status to 'assigned' when a driver is found.
+        res = await conn.execute(_INS_RIDE, {
+            "rider_id": req.rider_id,
+            "pickup": pickup_d,
+            "destination": dest_d,
+            "tier": req.tier,
+            "payment_method": req.payment_method,
+            "status": models.RIDE_NO_DRIVER,
+        })
+        ride_id = res.scalar_one()
+        driver_id = await _resolve_match()
+        status = models.RIDE_ASSIGNED if driver_id else models.RIDE_NO_DRIVER
+
+    if driver_id:
+        # reuse the handler connection and its open transaction; a second
+        # engine.begin() here meant another pool acquisition and commit per
+        # matched ride
+        await services.create_assignment(conn, ride_id, driver_id)
+        logger.info("assignment_created_from_discovery: ride=%s driver=%s", ride_id, driver_id)
+
+    # plain dict straight into ORJSONResponse; running trusted internal data
+    # back through a response model would just re-validate it
+    output = {"id": ride_id, "status": status, "pickup": pickup_d, "destination": dest_d}
+    if idempotency_key:
+        # idempotency records are immutable, so no invalidation needed
+        await redis_client.set(f"idem:{idempotency_key}", orjson.dumps(output), ex=86400)
     logger.info("ride_created: id=%s status=%s", ride_id, status)
     return output
 
 
 @router.get("/rides/{ride_id}")
-async def get_ride(ride_id: int, conn=Depends(get_conn)):
-    sel = select(models.rides).where(models.rides.c.id == ride_id)
-    r_res = await conn.execute(sel)
-    r = r_res.first()
-    if not r:
+async def get_ride(ride_id: int, conn=Depends(get_read_conn)):
+    # ride + assignment come back in one outer-joined round trip
+    rm = (await conn.execute(_SEL_RIDE_WITH_ASSIGN, {"rid": ride_id})).mappings().first()
+    if rm is None:
         raise HTTPException(status_code=404, detail="ride not found")
-    rm = r._mapping if hasattr(r, "_mapping") else None
-    if rm is not None:
-        resp = {"id": rm[models.rides.c.id], "status": rm[models.rides.c.status], "pickup": rm[models.rides.c.pickup], "destination": rm[models.rides.c.destination]}
-    else:
-        # fallback to positional access
-        resp = {"id": r[0], "status": r[6] if len(r) > 6 else None, "pickup": r[3] if len(r) > 3 else None, "destination": r[4] if len(r) > 4 else None}
-    a_sel = select(models.assignments).where(models.assignments.c.ride_id == ride_id)
-    a_res = await conn.execute(a_sel)
-    a = a_res.first()
-    if a:
-        am = a._mapping if hasattr(a, "_mapping") else None
-        if am is not None:
-            resp["assignment"] = {"id": am[models.assignments.c.id], "driver_id": am[models.assignments.c.driver_id], "status": am[models.assignments.c.status]}
-        else:
-            resp["assignment"] = {"id": a[0], "driver_id": a[2] if len(a) > 2 else None, "status": a[3] if len(a) > 3 else None}
+    resp = {"id": rm["id"], "status": rm["status"], "pickup": rm["pickup"], "destination": rm["destination"]}
+    if rm["assign_id"] is not None:
+        resp["assignment"] = {"id": rm["assign_id"], "driver_id": rm["driver_id"], "status": rm["assign_status"]}
     return resp
 
 
 @router.post("/drivers/{driver_id}/location")
-async def driver_location(driver_id: int, loc: schemas.Location, conn=Depends(get_conn)):
-    # Validate driver_id
-    if not isinstance(driver_id, int) or driver_id <= 0:
-        raise HTTPException(status_code=422, detail="driver_id must be a positive integer")
-    
-    # store location in redis (async)
-    await services.update_driver_location(driver_id, loc.lat, loc.lon)
-    logger.debug("driver_location: driver=%s lat=%s lon=%s", driver_id, loc.lat, loc.lon)
-    # mark driver as available if not present
-    sel = select(models.drivers).where(models.drivers.c.id == driver_id)
-    d_res = await conn.execute(sel)
-    d = d_res.first()
-    if not d:
-        await conn.execute(models.drivers.insert().values(id=driver_id, available=True))
+async def driver_location(driver_id: Annotated[int, Path(gt=0)], loc: schemas.Location, conn=Depends(get_conn)):
+    # stage the heartbeat for the batched pipeline flush; write through
+    # only when the flusher is not running
+    if not services.buffer_driver_location(driver_id, loc.lat, loc.lon):
+        await services.update_driver_location(driver_id, loc.lat, loc.lon)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("driver_location: driver=%s lat=%s lon=%s", driver_id, loc.lat, loc.lon)
+    # mark driver available with a single UPDATE instead of SELECT+INSERT;
+    # the in-process set answers repeat heartbeats for free, the Redis
+    # "driver known" flag covers other workers, and the DB is last resort.
+    # (Rows can no longer be auto-created here: registration owns the
+    # NOT NULL name/mobile columns.)
+    if driver_id not in _known_drivers:
+        known_key = f"driver_known:{driver_id}"
+        if await redis_client.get(known_key):
+            _known_drivers.add(driver_id)
+        else:
+            upd = await conn.execute(_UPD_DRIVER_AVAILABLE, {"did": driver_id})
+            if upd.rowcount:
+                _known_drivers.add(driver_id)
+                await redis_client.set(known_key, "1", ex=3600)
+            else:
+                logger.debug("driver_location: driver=%s not registered", driver_id)
     return {"status": "ok"}
 
 
 @router.post("/drivers/{driver_id}/accept")
-async def driver_accept(driver_id: int, payload: schemas.AcceptRequest, conn=Depends(get_conn)):
-    # Validate driver_id
-    if not isinstance(driver_id, int) or driver_id <= 0:
-        raise HTTPException(status_code=422, detail="driver_id must be a positive integer")
-    
+async def driver_accept(driver_id: Annotated[int, Path(gt=0)], payload: schemas.AcceptRequest, conn=Depends(get_conn)):
     logger.info("driver_accept: driver=%s assignment=%s", driver_id, payload.assignment_id)
     trip = await services.accept_assignment(conn, driver_id, payload.assignment_id)
     if not trip:
@@ -130,11 +257,7 @@ async def driver_accept(driver_id: int, payload: schemas.AcceptRequest, conn=Dep
 
 
 @router.post("/trips/{trip_id}/end")
-async def end_trip(trip_id: int, payload: schemas.EndTripRequest, conn=Depends(get_conn)):
-    # Validate trip_id
-    if not isinstance(trip_id, int) or trip_id <= 0:
-        raise HTTPException(status_code=422, detail="trip_id must be a positive integer")
-    
+async def end_trip(trip_id: Annotated[int, Path(gt=0)], payload: schemas.EndTripRequest, conn=Depends(get_conn)):
     end_loc = None
     if payload.end_lat is not None and payload.end_lon is not None:
         end_loc = (payload.end_lat, payload.end_lon)
@@ -145,119 +268,75 @@ async def end_trip(trip_id: int, payload: schemas.EndTripRequest, conn=Depends(g
     return {"trip_id": trip.get('id'), "fare": trip.get('fare'), "status": trip.get('status')}
 
 
-@router.post("/payments", response_model=schemas.Receipt)
-async def trigger_payment(req: schemas.PaymentRequest, conn=Depends(get_conn)):
-    # Get payment record
-    p_sel = select(models.payments).where(models.payments.c.trip_id == req.trip_id).order_by(desc(models.payments.c.id))
-    p_res = await conn.execute(p_sel)
-    p = p_res.first()
-    if not p:
+@router.post("/payments")
+async def trigger_payment(req: schemas.PaymentRequest, conn=Depends(get_read_conn)):
+    # payment + trip + ride details in a single joined round trip
+    rm = (await conn.execute(_SEL_PAYMENT_RECEIPT, {"tid": req.trip_id})).mappings().first()
+    if rm is None:
         raise HTTPException(status_code=404, detail="payment not found")
-    
-    payment_id = p[models.payments.c.id]
-    amount = p[models.payments.c.amount]
-    payment_status = p[models.payments.c.status]
-    
-    # Get trip details
-    t_sel = select(models.trips).where(models.trips.c.id == req.trip_id)
-    t_res = await conn.execute(t_sel)
-    t = t_res.first()
-    if not t:
-        raise HTTPException(status_code=404, detail="trip not found")
-    
-    trip_id = t[models.trips.c.id]
-    ride_id = t[models.trips.c.ride_id]
-    driver_id = t[models.trips.c.driver_id]
-    distance_km = t[models.trips.c.distance_km]
-    duration_sec = t[models.trips.c.duration_sec]
-    
-    # Get ride details
-    r_sel = select(models.rides).where(models.rides.c.id == ride_id)
-    r_res = await conn.execute(r_sel)
-    r = r_res.first()
-    if not r:
-        raise HTTPException(status_code=404, detail="ride not found")
-    
-    rider_id = r[models.rides.c.rider_id]
-    pickup = r[models.rides.c.pickup]
-    destination = r[models.rides.c.destination]
-    payment_method = r[models.rides.c.payment_method]
-    
+
     # Trigger payment if pending
-    if payment_status == models.PAY_PENDING:
-        logger.info("trigger_payment: scheduling payment simulation for payment_id=%s", payment_id)
-        asyncio.create_task(services._simulate_payment(payment_id))
-    
-    logger.info("payment_receipt: payment_id=%s trip_id=%s amount=%.2f", payment_id, trip_id, amount)
-    
-    return schemas.Receipt(
-        payment_id=payment_id,
-        trip_id=trip_id,
-        rider_id=rider_id,
-        driver_id=driver_id,
-        amount=amount,
-        payment_method=payment_method,
-        status=payment_status,
-        distance_km=distance_km,
-        duration_sec=duration_sec,
-        pickup=pickup,
-        destination=destination,
-        timestamp=datetime.now(timezone.utc)
-    )
+    if rm["payment_status"] == models.PAY_PENDING:
+        logger.info("trigger_payment: scheduling payment simulation for payment_id=%s", rm["payment_id"])
+        services.enqueue_payment(rm["payment_id"])
+
+    logger.info("payment_receipt: payment_id=%s trip_id=%s amount=%.2f", rm["payment_id"], rm["trip_id"], rm["amount"])
 
+    return {
+        "payment_id": rm["payment_id"],
+        "trip_id": rm["trip_id"],
+        "rider_id": rm["rider_id"],
+        "driver_id": rm["driver_id"],
+        "amount": rm["amount"],
+        "payment_method": rm["payment_method"],
+        "status": rm["payment_status"],
+        "distance_km": rm["distance_km"],
+        "duration_sec": rm["duration_sec"],
+        "pickup": rm["pickup"],
+        "destination": rm["destination"],
+        "timestamp": datetime.now(timezone.utc),
+    }
 
-@router.post("/riders/register", response_model=schemas.UserRegistrationResponse, status_code=201)
+
+@router.post("/riders/register", status_code=201)
 async def register_rider(req: schemas.RiderRegister, conn=Depends(get_conn)):
     logger.info("register_rider: mobile=%s", req.mobile_number)
     
-    # Check if mobile number already exists
-    check_sel = select(models.riders).where(models.riders.c.mobile_number == req.mobile_number)
-    check_res = await conn.execute(check_sel)
-    existing = check_res.first()
-    if existing:
+    # Single atomic round trip; no row back means the mobile number lost
+    # the unique race or already existed
+    res = await conn.execute(_INS_RIDER, {
+        "first_name": req.first_name,
+        "last_name": req.last_name,
+        "mobile_number": req.mobile_number,
+        "email": req.email,
+        "address": req.address,
+    })
+    user_id = res.scalar()
+    if user_id is None:
         raise HTTPException(status_code=400, detail="Mobile number already registered")
     
-    # Atomic insert within same transaction
-    res = await conn.execute(
-        models.riders.insert().returning(models.riders.c.id).values(
-            first_name=req.first_name,
-            last_name=req.last_name,
-            mobile_number=req.mobile_number,
-            email=req.email,
-            address=req.address,
-            created_at=datetime.now(timezone.utc)
-        )
-    )
-    user_id = res.scalar_one()
-    
     logger.info("rider_registered: user_id=%s mobile=%s", user_id, req.mobile_number)
-    return schemas.UserRegistrationResponse(user_id=user_id, message="Rider registered successfully")
+    return {"user_id": user_id, "message": "Rider registered successfully"}
 
 
-@router.post("/drivers/register", response_model=schemas.UserRegistrationResponse, status_code=201)
+@router.post("/drivers/register", status_code=201)
 async def register_driver(req: schemas.DriverRegister, conn=Depends(get_conn)):
     logger.info("register_driver: mobile=%s", req.mobile_number)
     
-    # Check if mobile number already exists
-    check_sel = select(models.drivers).where(models.drivers.c.mobile_number == req.mobile_number)
-    check_res = await conn.execute(check_sel)
-    existing = check_res.first()
-    if existing:
+    # Single atomic round trip; no row back means the mobile number lost
+    # the unique race or already existed
+    res = await conn.execute(_INS_DRIVER, {
+        "first_name": req.first_name,
+        "last_name": req.last_name,
+        "mobile_number": req.mobile_number,
+        "email": req.email,
+        "address": req.address,
+        "available": True,
+    })
+    user_id = res.scalar()
+    if user_id is None:
         raise HTTPException(status_code=400, detail="Mobile number already registered")
-    
-    # Atomic insert within same transaction
-    res = await conn.execute(
-        models.drivers.insert().returning(models.drivers.c.id).values(
-            first_name=req.first_name,
-            last_name=req.last_name,
-            mobile_number=req.mobile_number,
-            email=req.email,
-            address=req.address,
-            available=True,
-            created_at=datetime.now(timezone.utc)
-        )
-    )
-    user_id = res.scalar_one()
+    _known_drivers.add(user_id)
     
     logger.info("driver_registered: user_id=%s mobile=%s", user_id, req.mobile_number)
-    return schemas.UserRegistrationResponse(user_id=user_id, message="Driver registered successfully")
+    return {"user_id": user_id, "message": "Driver registered successfully"}
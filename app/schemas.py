@@ -1,45 +1,32 @@
-from pydantic import BaseModel, Field, conlist, field_validator
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional
-from enum import Enum
-from datetime import datetime
 
 
 class Location(BaseModel):
+    # pydantic-core validates and serializes these in Rust; forbid extras so
+    # malformed payloads fail fast instead of silently carrying dead weight
+    model_config = ConfigDict(extra="forbid")
+
     lat: float
     lon: float
 
 
 class RideCreate(BaseModel):
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
     rider_id: Optional[int] = Field(None, gt=0)
     pickup: Location
     destination: Location
     tier: Optional[str] = Field("standard", max_length=50)
     payment_method: Optional[str] = Field("card", max_length=50)
-    
-    @field_validator('rider_id')
-    @classmethod
-    def validate_rider_id(cls, v):
-        if v is not None and (not isinstance(v, int) or v <= 0):
-            raise ValueError('rider_id must be a positive integer')
-        return v
-
-
-class RideOut(BaseModel):
-    id: int
-    status: str
-    pickup: dict
-    destination: dict
 
 
 class AcceptRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    # Field(gt=0) is enforced natively by pydantic-core; no Python-level
+    # validator needed
     assignment_id: int = Field(..., gt=0)
-    
-    @field_validator('assignment_id')
-    @classmethod
-    def validate_assignment_id(cls, v):
-        if not isinstance(v, int) or v <= 0:
-            raise ValueError('assignment_id must be a positive integer')
-        return v
 
 
 class EndTripRequest(BaseModel):
@@ -48,15 +35,10 @@ class EndTripRequest(BaseModel):
 
 
 class PaymentRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
     trip_id: int = Field(..., gt=0)
     method: Optional[str] = Field("card", max_length=50)
-    
-    @field_validator('trip_id')
-    @classmethod
-    def validate_trip_id(cls, v):
-        if not isinstance(v, int) or v <= 0:
-            raise ValueError('trip_id must be a positive integer')
-        return v
 
 
 class RiderRegister(BaseModel):
@@ -73,23 +55,3 @@ class DriverRegister(BaseModel):
     mobile_number: str = Field(..., min_length=10, max_length=15)
     email: Optional[str] = Field(None, max_length=255)
     address: Optional[str] = Field(None, max_length=500)
-
-
-class UserRegistrationResponse(BaseModel):
-    user_id: int
-    message: str
-
-
-class Receipt(BaseModel):
-    payment_id: int
-    trip_id: int
-    rider_id: Optional[int]
-    driver_id: int
-    amount: float
-    payment_method: str
-    status: str
-    distance_km: float
-    duration_sec: int
-    pickup: dict
-    destination: dict
-    timestamp: datetime
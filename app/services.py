@@ -1,98 +1,256 @@
 from math import radians, cos, sin, asin, sqrt
 from datetime import datetime, timezone
+import time
 from typing import Optional, Dict, Tuple
 from .config import settings
 from . import db, models
-from sqlalchemy import select, insert, update, and_, desc
+from sqlalchemy import select, insert, update, and_, func, literal, cast, String, text
 import asyncio
 from .cache import redis_client
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Fire-and-forget tasks need strong references (or they can be GC'd
+# mid-flight) and a concurrency bound so a burst can't pile up coroutines
+# all holding DB connections.
+_BG_TASKS: set = set()
+_bg_semaphore: Optional[asyncio.Semaphore] = None
+
+
+# Payments are settled by a fixed pool of workers draining a bounded queue
+# (started in the app lifespan); per-request create_task gave no backpressure
+# under spikes. Workers opportunistically drain the queue into micro-batches
+# so a burst settles with one UPDATE instead of one per payment.
+PAYMENT_QUEUE_MAX = 10_000
+PAYMENT_WORKERS = 8
+PAYMENT_BATCH_MAX = 50
+
+payment_queue: Optional[asyncio.Queue] = None
+
+
+def enqueue_payment(payment_id: int) -> None:
+    """Hand a payment to the worker pool.
+
+    Falls back to a fire-and-forget task when the queue is not running
+    (scripts, tests) or full.
+    """
+    if payment_queue is not None:
+        try:
+            payment_queue.put_nowait(payment_id)
+            return
+        except asyncio.QueueFull:
+            logger.warning("enqueue_payment: queue full, running payment=%s standalone", payment_id)
+    spawn_background(_simulate_payment(payment_id))
+
+
+async def payment_worker(queue: asyncio.Queue) -> None:
+    """Drain payment ids in micro-batches and settle each batch at once."""
+    while True:
+        batch = [await queue.get()]
+        try:
+            while len(batch) < PAYMENT_BATCH_MAX:
+                batch.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            pass
+        try:
+            await _simulate_payments_batch(batch)
+        except Exception:
+            logger.exception("payment_worker: batch of %d payments failed", len(batch))
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
+def spawn_background(coro) -> "asyncio.Task":
+    """Schedule a fire-and-forget coroutine with bounded concurrency."""
+    global _bg_semaphore
+    if _bg_semaphore is None:
+        _bg_semaphore = asyncio.Semaphore(settings.BG_MAX_CONCURRENCY)
+
+    async def _guarded():
+        async with _bg_semaphore:
+            await coro
+
+    task = asyncio.create_task(_guarded())
+    _BG_TASKS.add(task)
+    task.add_done_callback(_BG_TASKS.discard)
+    return task
+
 
 def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
-    lat1, lon1 = a
-    lat2, lon2 = b
-    # convert decimal degrees to radians
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    # haversine
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * asin(sqrt(a))
-    km = 6371 * c
-    return km
-
-
-async def invalidate_driver_cache(driver_id: int):
-    """Remove driver from all caches (hash and geo index)."""
-    driver_key = f"driver:{driver_id}"
-    await redis_client.delete(driver_key)
-    await redis_client.zrem("drivers_geo", driver_id)
-    logger.info("cache_invalidated: driver=%s", driver_id)
+    # straight-line radians conversions: map() over a fresh list cost two
+    # allocations and iterator setup per call
+    lat1 = radians(a[0])
+    lon1 = radians(a[1])
+    lat2 = radians(b[0])
+    lon2 = radians(b[1])
+    h = sin((lat2 - lat1) * 0.5) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) * 0.5) ** 2
+    return 6371 * 2 * asin(sqrt(h))
 
 
-async def cleanup_stale_drivers():
-    """Background task to remove stale drivers from geo index.
-    
-    Removes drivers from geo index whose hash keys have expired.
+async def _sweep_stale_drivers():
+    """Remove geo-index members whose driver hash no longer exists.
+
+    Backstop for expiry notifications missed while the listener was not
+    subscribed; one pipelined EXISTS per member instead of a round trip
+    each.
     """
-    try:
-        # Get all driver IDs from geo index
-        all_drivers = await redis_client.zrange("drivers_geo", 0, -1)
-        removed_count = 0
-        for driver_id in all_drivers:
+    members = await redis_client.zrange("drivers_geo", 0, -1)
+    if not members:
+        return
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for member in members:
+            pipe.exists(f"driver:{member}")
+        alive = await pipe.execute()
+    stale = [m for m, ok in zip(members, alive) if not ok]
+    if stale:
+        await redis_client.zrem("drivers_geo", *stale)
+        logger.info("_sweep_stale_drivers: removed %d stale drivers from geo index", len(stale))
+
+
+async def expired_driver_listener():
+    """Drop expired driver hashes from the geo index reactively.
+
+    Subscribes to keyspace expiry events instead of polling the whole
+    drivers_geo zset with an EXISTS per member; the server must have
+    notify-keyspace-events including "Ex", which is enabled here best
+    effort via CONFIG SET. Notifications are fire-and-forget, so each
+    (re)subscribe is followed by a full sweep to catch anything that
+    expired while nobody was listening, and connection failures retry
+    with backoff instead of killing the task.
+    """
+    backoff = 1.0
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            try:
+                await redis_client.config_set("notify-keyspace-events", "Ex")
+            except Exception:
+                logger.warning("expired_driver_listener: could not enable keyspace notifications")
+            # db-agnostic pattern: the URL may point at any logical database
+            await pubsub.psubscribe("__keyevent@*__:expired")
+            await _sweep_stale_drivers()
+            backoff = 1.0
+            async for message in pubsub.listen():
+                if message.get("type") != "pmessage":
+                    continue
+                key = message.get("data")
+                if isinstance(key, bytes):
+                    key = key.decode()
+                if isinstance(key, str) and key.startswith("driver:"):
+                    driver_id = key.split(":", 1)[1]
+                    await redis_client.zrem("drivers_geo", driver_id)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("expired_driver_listener: removed driver=%s from geo index", driver_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("expired_driver_listener: subscription lost, retrying in %.0fs", backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+
+# Driver coordinates live in one fixed-point integer field: microdegree
+# lat/lon packed into a single int64 ("ll"). That halves the hash payload
+# versus two stringified floats and costs one int parse per read instead of
+# two float parses. The geo index is untouched (it keeps its own geohash).
+_COORD_SCALE = 1e7
+
+
+def _pack_latlon(lat: float, lon: float) -> int:
+    lat_i = int(round(lat * _COORD_SCALE))
+    lon_i = int(round(lon * _COORD_SCALE))
+    return (lat_i << 32) | (lon_i & 0xFFFFFFFF)
+
+
+def _unpack_latlon(ll) -> Tuple[float, float]:
+    ll = int(ll)
+    lat_i = ll >> 32
+    lon_i = ll & 0xFFFFFFFF
+    if lon_i >= 0x80000000:
+        lon_i -= 0x100000000
+    return (lat_i / _COORD_SCALE, lon_i / _COORD_SCALE)
+
+
+# Heartbeats are buffered per driver and flushed as one pipeline every
+# LOC_FLUSH_INTERVAL seconds (task started in the app lifespan); for a fleet
+# pinging every few seconds this collapses thousands of Redis round trips
+# into ~10/s, at the cost of up to ~100ms of location staleness.
+LOC_FLUSH_INTERVAL = 0.1
+
+loc_buffer: Dict[int, Tuple[float, float]] = {}
+loc_flusher_task: Optional[asyncio.Task] = None
+
+
+def buffer_driver_location(driver_id: int, lat: float, lon: float) -> bool:
+    """Stage a heartbeat for the next pipeline flush.
+
+    Returns False when the flusher is not running (scripts, tests) so the
+    caller can write through directly.
+    """
+    if loc_flusher_task is None:
+        return False
+    loc_buffer[driver_id] = (lat, lon)
+    return True
+
+
+async def flush_driver_locations():
+    if not loc_buffer:
+        return
+    staged = list(loc_buffer.items())
+    loc_buffer.clear()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for driver_id, (lat, lon) in staged:
             driver_key = f"driver:{driver_id}"
-            # Check if hash key still exists
-            if not await redis_client.exists(driver_key):
-                # Hash expired, remove from geo index
-                await redis_client.zrem("drivers_geo", driver_id)
-                removed_count += 1
-        if removed_count > 0:
-            logger.info("cleanup_stale_drivers: removed %d stale drivers from geo index", removed_count)
-    except Exception as e:
-        logger.error("cleanup_stale_drivers: error during cleanup: %s", e)
+            pipe.hset(driver_key, mapping={"ll": _pack_latlon(lat, lon)})
+            pipe.expire(driver_key, 300)
+            pipe.execute_command("GEOADD", "drivers_geo", lon, lat, driver_id)
+        await pipe.execute()
+    logger.debug("flush_driver_locations: flushed %d drivers", len(staged))
+
+
+async def location_flusher():
+    while True:
+        await asyncio.sleep(LOC_FLUSH_INTERVAL)
+        try:
+            await flush_driver_locations()
+        except Exception:
+            logger.exception("location_flusher: flush failed")
 
 
 async def update_driver_location(driver_id: int, lat: float, lon: float):
     driver_key = f"driver:{driver_id}"
-    # store lat/lon in hash for quick lookup with timestamp
-    await redis_client.hset(driver_key, mapping={
-        "lat": lat, 
-        "lon": lon,
-        "timestamp": datetime.now(timezone.utc).timestamp()
-    })
-    # Set TTL of 5 minutes (300 seconds)
-    await redis_client.expire(driver_key, 300)
-    await redis_client.execute_command("GEOADD", "drivers_geo", lon, lat, driver_id)
-    logger.debug("update_driver_location: driver=%s lat=%s lon=%s", driver_id, lat, lon)
+    # store lat/lon hash + 5 minute TTL + geo index update in one
+    # pipelined round trip instead of three sequential commands
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hset(driver_key, mapping={"ll": _pack_latlon(lat, lon)})
+        pipe.expire(driver_key, 300)
+        pipe.execute_command("GEOADD", "drivers_geo", lon, lat, driver_id)
+        await pipe.execute()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("update_driver_location: driver=%s lat=%s lon=%s", driver_id, lat, lon)
 
-async def get_driver_location(driver_id: int, max_age_sec: int = 300) -> Optional[Tuple[float, float]]:
-    """Get driver location from cache with freshness validation.
+async def get_driver_location(driver_id: int) -> Optional[Tuple[float, float]]:
+    """Get driver location from cache.
     
-    Args:
-        driver_id: The driver ID
-        max_age_sec: Maximum age of cached data in seconds (default 5 minutes)
+    Freshness is delegated to the 5-minute TTL on the hash: an expired key
+    simply comes back empty, so no timestamp bookkeeping is needed here.
     
     Returns:
-        Tuple of (lat, lon) or None if not found or stale
+        Tuple of (lat, lon) or None if not found
     """
-    driver_key = f"driver:{driver_id}"
-    data = await redis_client.hgetall(driver_key)
-    if not data:
+    ll = await redis_client.hget(f"driver:{driver_id}", "ll")
+    if ll is None:
         return None
     try:
-        # Validate freshness if timestamp exists
-        if "timestamp" in data:
-            timestamp = float(data["timestamp"])
-            age = datetime.now(timezone.utc).timestamp() - timestamp
-            if age > max_age_sec:
-                logger.debug("get_driver_location: driver=%s location stale (age=%.1fs), invalidating", driver_id, age)
-                await invalidate_driver_cache(driver_id)
-                return None
-        return (float(data.get("lat")), float(data.get("lon")))
-    except Exception as e:
+        return _unpack_latlon(ll)
+    except (TypeError, ValueError) as e:
         logger.warning("get_driver_location: driver=%s error parsing data: %s", driver_id, e)
         return None
 
@@ -104,144 +262,180 @@ async def find_nearest_driver(pickup: Tuple[float, float], max_km: float = None)
     """
     max_km = max_km or settings.MATCH_RADIUS_KM
     lat, lon = pickup[0], pickup[1]
-    # GEORADIUS: drivers_geo lon lat radius km WITHDIST COUNT 50 ASC
+    # GEOSEARCH (GEORADIUS is deprecated since Redis 6.2 and routes through
+    # a compat layer); WITHCOORD rides along so callers never need a
+    # follow-up position read
     try:
-        res = await redis_client.execute_command("GEORADIUS", "drivers_geo", lon, lat, max_km, "km", "WITHDIST", "COUNT", 50, "ASC")
+        res = await redis_client.execute_command(
+            "GEOSEARCH", "drivers_geo", "FROMLONLAT", lon, lat,
+            "BYRADIUS", max_km, "km", "ASC", "COUNT", 50, "WITHCOORD", "WITHDIST",
+        )
     except Exception:
-        logger.exception("find_nearest_driver: redis GEORADIUS failed")
+        logger.exception("find_nearest_driver: redis GEOSEARCH failed")
         return None
     if not res:
         return None
-    # res elements are [member, dist] when WITHDIST used
+    # Redis already computed and distance-sorted the candidates; trust the
+    # WITHDIST values instead of re-fetching every hash and recomputing
+    # haversine client-side. Only the driver about to be picked gets a
+    # freshness check.
+    # entries are [member, dist, [lon, lat]] with WITHDIST + WITHCOORD
     for entry in res:
-        # entry may be [member, dist] or (member, dist)
         try:
-            member = entry[0]
-        except Exception:
+            member, dist = entry[0], float(entry[1])
+        except (IndexError, TypeError, ValueError):
             continue
+        if dist > max_km:
+            # ASC order: everyone after this one is farther out
+            break
         try:
-            did = int(member)
-        except Exception:
-            # member might be bytes/str
-            try:
-                did = int(member.decode() if isinstance(member, bytes) else member)
-            except Exception:
-                continue
-        # verify location exists and distance constraint
-        loc = await get_driver_location(did)
-        if not loc:
+            did = int(member.decode() if isinstance(member, bytes) else member)
+        except (AttributeError, ValueError):
+            continue
+        if await get_driver_location(did) is None:
+            # hash expired or stale; fall through to the next nearest
             continue
-        dist = haversine_km(pickup, loc)
-        if dist <= max_km:
-            logger.info("find_nearest_driver: found driver=%s dist_km=%.3f", did, dist)
-            return did
+        logger.info("find_nearest_driver: found driver=%s dist_km=%.3f", did, dist)
+        return did
     return None
 
 
+# Fused assignment insert + ride status update: one round trip instead of
+# two, same pattern as the ride + idempotency-key CTE in routes
+_INS_ASSIGNMENT_WITH_RIDE_UPDATE = text("""
+    WITH new_assignment AS (
+        INSERT INTO assignments (ride_id, driver_id, status, offered_at)
+        VALUES (:ride_id, :driver_id, :assign_status, now())
+        RETURNING id
+    ), ride_update AS (
+        UPDATE rides SET status = :ride_status WHERE id = :ride_id
+    )
+    SELECT id FROM new_assignment
+""")
+
+
 async def create_assignment(conn, ride_id: int, driver_id: int) -> int:
-    # atomically insert assignment and update ride status
-    async with conn.begin():
-        res = await conn.execute(
-            insert(models.assignments).returning(models.assignments.c.id).values(ride_id=ride_id, driver_id=driver_id, status=models.ASSIGN_OFFERED, offered_at=datetime.now(timezone.utc))
-        )
-        assign_id = res.scalar_one()
-        await conn.execute(
-            update(models.rides).where(models.rides.c.id == ride_id).values(status=models.RIDE_ASSIGNED)
-        )
+    # runs on the caller's connection inside its already-begun transaction;
+    # the CTE lands both writes in a single network + parse round
+    res = await conn.execute(_INS_ASSIGNMENT_WITH_RIDE_UPDATE, {
+        "ride_id": ride_id,
+        "driver_id": driver_id,
+        "assign_status": models.ASSIGN_OFFERED,
+        "ride_status": models.RIDE_ASSIGNED,
+    })
+    assign_id = res.scalar_one()
     logger.info("create_assignment: assign_id=%s ride=%s driver=%s", assign_id, ride_id, driver_id)
-    # start expiry watcher after commit
-    asyncio.create_task(_expire_assignment_worker(assign_id))
+    # durable expiry: score the assignment in a Redis zset; one worker pops
+    # due entries instead of a sleeping task (and DB conn) per open offer
+    await redis_client.zadd("assign_expiry", {str(assign_id): time.time() + settings.ASSIGNMENT_TTL_SEC})
     return assign_id
 
 
-async def _expire_assignment_worker(assignment_id: int):
-    ttl = settings.ASSIGNMENT_TTL_SEC
-    await asyncio.sleep(ttl)
-    async with db.engine.connect() as conn:
-        sel = select(models.assignments).where(models.assignments.c.id == assignment_id)
-        res = await conn.execute(sel)
-        row = res.first()
-        if row and row[models.assignments.c.status] == models.ASSIGN_OFFERED:
-            async with conn.begin():
+ASSIGN_EXPIRY_POLL_SEC = 1.0
+
+
+async def assignment_expiry_worker():
+    """Expire overdue offers from the assign_expiry zset.
+
+    A single loop replaces the per-assignment sleeping tasks: memory stays
+    O(1) in open offers and pending expirations survive process restarts
+    because the deadline lives in Redis.
+    """
+    while True:
+        await asyncio.sleep(ASSIGN_EXPIRY_POLL_SEC)
+        try:
+            due = await redis_client.zrangebyscore("assign_expiry", 0, time.time())
+            if not due:
+                continue
+            await redis_client.zrem("assign_expiry", *due)
+            ids = [int(d.decode() if isinstance(d, bytes) else d) for d in due]
+            async with db.engine.begin() as conn:
+                rows = (await conn.execute(
+                    select(models.assignments.c.id, models.assignments.c.ride_id)
+                    .where(and_(models.assignments.c.id.in_(ids),
+                                models.assignments.c.status == models.ASSIGN_OFFERED))
+                )).all()
+                if not rows:
+                    continue
+                expired_ids = [r[0] for r in rows]
+                ride_ids = [r[1] for r in rows]
                 await conn.execute(
-                    update(models.assignments).where(models.assignments.c.id == assignment_id).values(status=models.ASSIGN_EXPIRED)
+                    update(models.assignments).where(models.assignments.c.id.in_(expired_ids)).values(status=models.ASSIGN_EXPIRED)
                 )
-                # set ride back to searching
+                # set the affected rides back to searching
                 await conn.execute(
-                    update(models.rides).where(models.rides.c.id == row[models.assignments.c.ride_id]).values(status=models.RIDE_SEARCHING)
+                    update(models.rides).where(models.rides.c.id.in_(ride_ids)).values(status=models.RIDE_SEARCHING)
                 )
-                logger.info("expire_assignment: assignment=%s expired", assignment_id)
-
+            logger.info("assignment_expiry_worker: expired %d assignments", len(expired_ids))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("assignment_expiry_worker: sweep failed")
 
 
 async def accept_assignment(conn, driver_id: int, assignment_id: int) -> Optional[dict]:
-    sel = select(models.assignments).where(and_(models.assignments.c.id == assignment_id, models.assignments.c.driver_id == driver_id))
-    # perform select + update + insert in a transaction
-    async with conn.begin():
-        res = await conn.execute(sel)
-        row = res.first()
-        if not row:
-            logger.warning("accept_assignment: assignment=%s driver=%s not found", assignment_id, driver_id)
-            return None
-        rm = row._mapping if hasattr(row, "_mapping") else None
-        assignment_status = rm[models.assignments.c.status] if rm else row[3]
-        if assignment_status != models.ASSIGN_OFFERED:
-            logger.warning("accept_assignment: assignment=%s status=%s not offered", assignment_id, assignment_status)
-            return None
-        await conn.execute(
-            update(models.assignments).where(models.assignments.c.id == assignment_id).values(status=models.ASSIGN_ACCEPTED)
-        )
-        # create trip
-        ride_id = rm[models.assignments.c.ride_id] if rm else row[1]
-        res2 = await conn.execute(
-            insert(models.trips).returning(models.trips.c.id).values(ride_id=ride_id, driver_id=driver_id, start_at=datetime.now(timezone.utc), status=models.TRIP_ONGOING)
-        )
-        trip_id = res2.scalar_one()
-        logger.info("accept_assignment: assignment=%s trip=%s driver=%s", assignment_id, trip_id, driver_id)
-    trip_sel = select(models.trips).where(models.trips.c.id == trip_id)
-    trip_row = (await conn.execute(trip_sel)).first()
-    if trip_row:
-        # Convert row to dict using _mapping if available
-        trip_dict = dict(trip_row._mapping) if hasattr(trip_row, "_mapping") else {"id": trip_row[0], "status": trip_row[6] if len(trip_row) > 6 else None}
-        return trip_dict
-    return None
+    # runs on the caller's connection/transaction; the trip row comes back
+    # from RETURNING instead of a follow-up SELECT
+    row = (await conn.execute(
+        select(models.assignments.c.ride_id, models.assignments.c.status)
+        .where(and_(models.assignments.c.id == assignment_id, models.assignments.c.driver_id == driver_id))
+    )).first()
+    if not row:
+        logger.warning("accept_assignment: assignment=%s driver=%s not found", assignment_id, driver_id)
+        return None
+    ride_id, assignment_status = row
+    if assignment_status != models.ASSIGN_OFFERED:
+        logger.warning("accept_assignment: assignment=%s status=%s not offered", assignment_id, assignment_status)
+        return None
+    await conn.execute(
+        update(models.assignments).where(models.assignments.c.id == assignment_id).values(status=models.ASSIGN_ACCEPTED)
+    )
+    trip = (await conn.execute(
+        insert(models.trips).returning(models.trips).values(ride_id=ride_id, driver_id=driver_id, status=models.TRIP_ONGOING)
+    )).mappings().one()
+    logger.info("accept_assignment: assignment=%s trip=%s driver=%s", assignment_id, trip["id"], driver_id)
+    return dict(trip)
 
 
 
 async def end_trip(conn, trip_id: int, end_loc: Optional[Tuple[float, float]] = None) -> Optional[dict]:
-    sel = select(models.trips).where(models.trips.c.id == trip_id)
-    res = await conn.execute(sel)
-    row = res.first()
-    if not row:
+    trip = (await conn.execute(
+        select(models.trips).where(models.trips.c.id == trip_id)
+    )).mappings().first()
+    if not trip:
         return None
-    trip = dict(row)
     end_at = datetime.now(timezone.utc)
-    distance_km = trip.get("distance_km", 0.0)
+    distance_km = trip["distance_km"] or 0.0
     if end_loc:
-        start_loc = await get_driver_location(trip.get("driver_id"))
+        start_loc = await get_driver_location(trip["driver_id"])
         if start_loc:
             distance_km = haversine_km(start_loc, end_loc)
     duration_sec = 0
-    if trip.get("start_at"):
-        duration_sec = int((end_at - trip.get("start_at")).total_seconds())
+    if trip["start_at"]:
+        start_at = trip["start_at"]
+        if start_at.tzinfo is None:
+            # server_default now() comes back naive; treat it as UTC
+            start_at = start_at.replace(tzinfo=timezone.utc)
+        duration_sec = int((end_at - start_at).total_seconds())
     base = 2.0
     per_km = 1.5
     per_min = 0.2
     fare = base + distance_km * per_km + (duration_sec / 60.0) * per_min
     logger.info("end_trip: trip=%s end_loc=%s", trip_id, end_loc)
-    # update trip and insert payment atomically
-    async with conn.begin():
-        await conn.execute(
-            update(models.trips)
-            .where(models.trips.c.id == trip_id)
-            .values(end_at=end_at, distance_km=distance_km, duration_sec=duration_sec, fare=fare, status=models.TRIP_COMPLETED)
-        )
-        res2 = await conn.execute(insert(models.payments).returning(models.payments.c.id).values(trip_id=trip_id, amount=fare, status=models.PAY_PENDING))
-        payment_id = res2.scalar_one()
+    # update trip and insert payment on the caller's transaction; RETURNING
+    # hands back the completed row so no re-SELECT is needed
+    updated = (await conn.execute(
+        update(models.trips)
+        .where(models.trips.c.id == trip_id)
+        .values(end_at=end_at, distance_km=distance_km, duration_sec=duration_sec, fare=fare, status=models.TRIP_COMPLETED)
+        .returning(models.trips)
+    )).mappings().one()
+    payment_id = (await conn.execute(
+        insert(models.payments).returning(models.payments.c.id).values(trip_id=trip_id, amount=fare, status=models.PAY_PENDING)
+    )).scalar_one()
     # simulate payment in background
-    asyncio.create_task(_simulate_payment(payment_id))
-    trip.update({"end_at": end_at, "distance_km": distance_km, "duration_sec": duration_sec, "fare": fare, "status": models.TRIP_COMPLETED})
-    return trip
+    enqueue_payment(payment_id)
+    return dict(updated)
 
 
 async def _simulate_payment(payment_id: int):
@@ -252,3 +446,21 @@ async def _simulate_payment(payment_id: int):
             update(models.payments).where(models.payments.c.id == payment_id).values(status=models.PAY_SUCCESS, provider_response={"provider": "simulated", "id": f"pay_{payment_id}"})
         )
     logger.info("_simulate_payment: payment=%s marked success", payment_id)
+
+
+async def _simulate_payments_batch(payment_ids):
+    # one simulated provider call covers the whole batch
+    await asyncio.sleep(1)
+    async with db.engine.begin() as conn:
+        await conn.execute(
+            update(models.payments)
+            .where(models.payments.c.id.in_(payment_ids))
+            .values(
+                status=models.PAY_SUCCESS,
+                provider_response=func.json_build_object(
+                    "provider", "simulated",
+                    "id", literal("pay_") + cast(models.payments.c.id, String),
+                ),
+            )
+        )
+    logger.info("_simulate_payments_batch: %d payments marked success", len(payment_ids))
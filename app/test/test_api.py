@@ -1,74 +1,199 @@
 import time
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, update
+from sqlalchemy.pool import StaticPool
 from app.main import app
 import app.routes as routes
 import app.models as models
 import app.services as services
 
 
+class FakePipeline:
+    """Buffers commands like a redis pipeline; applied on execute()."""
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def hset(self, key, mapping=None):
+        self._ops.append(lambda: self._redis._hset(key, mapping))
+        return self
+
+    def set(self, key, value):
+        self._ops.append(lambda: self._redis._set(key, value))
+        return self
+
+    def expire(self, key, ttl):
+        self._ops.append(lambda: True)
+        return self
+
+    def execute_command(self, *args):
+        self._ops.append(lambda: self._redis._execute_command(*args))
+        return self
+
+    def hgetall(self, key):
+        self._ops.append(lambda: dict(self._redis.hashes.get(key, {})))
+        return self
+
+    def exists(self, key):
+        self._ops.append(lambda: 1 if key in self._redis.hashes or key in self._redis.kv else 0)
+        return self
+
+    async def execute(self):
+        results = [op() for op in self._ops]
+        self._ops = []
+        return results
+
+
 class FakeRedis:
     def __init__(self):
         self.hashes = {}
         self.sets = {}
+        self.kv = {}
+        self.geo = {}
+        self.zsets = {}
 
-    def hget(self, key, field):
+    def _hset(self, key, mapping=None):
+        self.hashes.setdefault(key, {}).update(mapping or {})
+
+    def _set(self, key, value):
+        self.kv[key] = value
+
+    def _execute_command(self, *args):
+        cmd = args[0].upper()
+        if cmd == "GEOADD":
+            _, lon, lat, member = args[1:5]
+            self.geo[str(member)] = (float(lat), float(lon))
+            return 1
+        if cmd in ("GEORADIUS", "GEOSEARCH"):
+            # distance filtering is exercised against real redis; the fake
+            # returns every known member with a zero distance
+            return [[m, "0.0"] for m in self.geo]
+        return None
+
+    async def hget(self, key, field):
         return self.hashes.get(key, {}).get(field)
 
-    def hgetall(self, key):
+    async def hgetall(self, key):
         return self.hashes.get(key, {})
 
-    def hset(self, key, mapping=None):
-        self.hashes.setdefault(key, {}).update(mapping or {})
+    async def hset(self, key, mapping=None):
+        self._hset(key, mapping)
 
-    def smembers(self, key):
-        return set(str(x) for x in self.sets.get(key, set()))
+    async def get(self, key):
+        return self.kv.get(key)
 
-    def sadd(self, key, member):
-        self.sets.setdefault(key, set()).add(member)
+    async def set(self, key, value, ex=None):
+        self._set(key, value)
 
-    def srem(self, key, member):
-        s = self.sets.get(key)
-        if s:
-            s.discard(member)
+    async def delete(self, key):
+        self.hashes.pop(key, None)
+        self.kv.pop(key, None)
 
-    def pipeline(self):
-        # for tests we can apply immediately
-        return self
+    async def exists(self, key):
+        return 1 if key in self.hashes or key in self.kv else 0
 
-    def execute(self):
+    async def expire(self, key, ttl):
         return True
 
+    async def zrange(self, key, start, end):
+        return list(self.geo)
+
+    async def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update({str(k): float(v) for k, v in mapping.items()})
+
+    async def zrangebyscore(self, key, lo, hi):
+        return [m for m, score in self.zsets.get(key, {}).items() if lo <= score <= hi]
+
+    async def zrem(self, key, *members):
+        for member in members:
+            self.geo.pop(str(member), None)
+            self.zsets.get(key, {}).pop(str(member), None)
+
+    async def execute_command(self, *args):
+        return self._execute_command(*args)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
 
 @staticmethod
 def _override_simulate_payment(payment_id, engine):
+    # commit explicitly: StaticPool shares one DBAPI connection, so closing
+    # without committing would roll back the request's in-flight transaction
     with engine.connect() as conn:
         conn.execute(
             update(models.payments).where(models.payments.c.id == payment_id).values(status=models.PAY_SUCCESS, provider_response={"provider": "test"})
         )
+        conn.commit()
 
 
 def setup_test_app():
     # in-memory sqlite engine for tests
-    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    # StaticPool keeps a single shared connection so the in-memory schema is
+    # visible from the TestClient's worker thread
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
     models.metadata.create_all(bind=engine)
 
+    class AsyncTx:
+        """Async transaction facade over a sync connection."""
+
+        def __init__(self, conn):
+            self._conn = conn
+            self._tx = None
+
+        async def __aenter__(self):
+            # reuse an autobegun transaction rather than erroring
+            if not self._conn.in_transaction():
+                self._tx = self._conn.begin()
+            return self._tx
+
+        async def __aexit__(self, exc_type, exc, tb):
+            if self._tx is not None:
+                if exc_type:
+                    self._tx.rollback()
+                else:
+                    self._tx.commit()
+            return False
+
+    class AsyncConnWrapper:
+        """Minimal async facade so handlers can await a sync test connection."""
+
+        def __init__(self, conn):
+            self._conn = conn
+
+        async def execute(self, *args, **kwargs):
+            return self._conn.execute(*args, **kwargs)
+
+        def begin(self):
+            return AsyncTx(self._conn)
+
     # override the get_conn dependency to use our test engine
     def override_get_conn():
         conn = engine.connect()
         try:
-            yield conn
+            yield AsyncConnWrapper(conn)
+            if conn.in_transaction():
+                conn.commit()
         finally:
             conn.close()
 
     app.dependency_overrides[routes.get_conn] = override_get_conn
+    app.dependency_overrides[routes.get_read_conn] = override_get_conn
 
     # fake redis
     fake_redis = FakeRedis()
     services.redis_client = fake_redis
+    routes.redis_client = fake_redis
 
-    # disable expiry worker and replace payment simulator
-    services._expire_assignment_worker = lambda *_: None
+    # replace the payment simulator (the expiry worker only runs under the
+    # lifespan, so nothing to disable)
     services._simulate_payment = lambda pid: _override_simulate_payment(pid, engine)
 
     client = TestClient(app)
@@ -78,8 +203,14 @@ def setup_test_app():
 def test_full_flow_create_ride_match_accept_end_and_pay():
     client, engine, fake_redis = setup_test_app()
 
-    # register a driver near pickup
-    driver_id = 1
+    # register a driver and place them near pickup
+    r = client.post("/v1/drivers/register", json={
+        "first_name": "Test",
+        "last_name": "Driver",
+        "mobile_number": "9876543210",
+    })
+    assert r.status_code == 201
+    driver_id = r.json()["user_id"]
     pickup = {"lat": 12.9716, "lon": 77.5946}
     r = client.post(f"/v1/drivers/{driver_id}/location", json=pickup)
     assert r.status_code == 200 and r.json()["status"] == "ok"
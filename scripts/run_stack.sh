@@ -33,13 +33,13 @@ trap cleanup EXIT INT TERM
 
 start_api() {
   echo "Starting API on http://$API_HOST:$API_PORT"
-  NEW_RELIC_CONFIG_FILE=/home/nikhil/goride/app/newrelic.ini newrelic-admin run-program python3 -m uvicorn app.main:app --host "$API_HOST" --port "$API_PORT" --reload &
+  NEW_RELIC_CONFIG_FILE=/home/nikhil/goride/app/newrelic.ini newrelic-admin run-program python3 -m uvicorn app.main:app --host "$API_HOST" --port "$API_PORT" --loop uvloop --http httptools --reload &
   pids+=($!)
 }
 
 start_discovery() {
   echo "Starting driver discovery on http://$API_HOST:$DISCOVERY_PORT"
-  python3 -m uvicorn app.driver_discovery:app --host "$API_HOST" --port "$DISCOVERY_PORT" --reload &
+  python3 -m uvicorn app.driver_discovery:app --host "$API_HOST" --port "$DISCOVERY_PORT" --loop uvloop --http httptools --reload &
   pids+=($!)
 }
 